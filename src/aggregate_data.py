@@ -1,5 +1,5 @@
 """Agrega os dados por movimento para formar estatísticas por rating de melhores movimentos"""
-from typing import Optional
+from typing import Optional, Literal
 
 import duckdb
 import pandas as pd
@@ -7,17 +7,56 @@ import pandas as pd
 
 # Conectar ao banco
 
-def definir_faixa_intervalo_sql(intervalo: int = 200) -> str:
+def _tabela_existe(con: duckdb.DuckDBPyConnection, tabela: str) -> bool:
+    return con.execute(
+        "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = ?", [tabela]
+    ).fetchone()[0] > 0
+
+
+def garantir_lances_expandidos(con: duckdb.DuckDBPyConnection, *, max_ply: Optional[int] = None) -> str:
+    """
+    Retorna a tabela de lances por posição a ser agregada.
+    Se existir a tabela compactada `games`, usa a expansão dela até `max_ply`, (re)expandindo
+    apenas se ainda não existir ou se `games` mudou desde então. Sem `games`, usa a tabela `moves`
+    gerada diretamente por `processa_pgn_para_duckdb`.
+    """
+    if not _tabela_existe(con, "games"):
+        return "moves"
+    from src.process_bulk_games import expandir_jogos_para_lances, nome_tabela_expansao, versao_games
+
+    tabela = nome_tabela_expansao(max_ply)
+    expansao = None
+    if _tabela_existe(con, "expansoes") and _tabela_existe(con, tabela):
+        expansao = con.execute(
+            "SELECT carga, n_jogos FROM expansoes WHERE tabela = ?", [tabela]
+        ).fetchone()
+    if expansao != versao_games(con):
+        expandir_jogos_para_lances(con, max_ply=max_ply)
+    return tabela
+
+
+def _coluna_rating(tabela: str, rating: Literal["media", "jogador"]) -> str:
+    """Coluna usada como rating: média dos jogadores ou rating de quem move"""
+    if rating == "media":
+        return "average_rating"
+    if rating != "jogador":
+        raise ValueError(f'Definição de rating inválida: {rating!r}')
+    if tabela == "moves":
+        raise ValueError('rating="jogador" requer a tabela compactada games')
+    return "mover_rating"
+
+
+def definir_faixa_intervalo_sql(intervalo: int = 200, coluna: str = "player_rating") -> str:
     """
     Retorna expressão SQL para criar faixas de rating.
     Ex: 800-999, 1000-1199...
     """
     return f"""
         CASE
-            WHEN player_rating IS NULL OR player_rating <= 0 THEN 'unknown'
+            WHEN {coluna} IS NULL OR {coluna} <= 0 THEN 'unknown'
             ELSE
-                CAST((player_rating/{intervalo})*{intervalo} AS VARCHAR) || '-' ||
-                CAST(((player_rating/{intervalo})*{intervalo} + {intervalo}-1) AS VARCHAR)
+                CAST(({coluna}/{intervalo})*{intervalo} AS VARCHAR) || '-' ||
+                CAST((({coluna}/{intervalo})*{intervalo} + {intervalo}-1) AS VARCHAR)
         END
     """
 
@@ -26,13 +65,17 @@ def estatisticas_de_lances_por_posicao(
     *,
     intervalo: int = 200,
     min_samples_move: int = 1,
+    max_ply: Optional[int] = None,
+    rating: Literal["media", "jogador"] = "media",
 ) -> pd.DataFrame:
     """
     Para cada (faixa de rating, posição/FEN, lance):
       - n (quantidade de amostras do lance)
       - win_rate (média de mover_score)
+    `max_ply` só se aplica, e `rating="jogador"` só existe, para lances expandidos da tabela compactada `games`.
     """
-    faixa_expr = definir_faixa_intervalo_sql(intervalo)
+    tabela = garantir_lances_expandidos(con, max_ply=max_ply)
+    faixa_expr = definir_faixa_intervalo_sql(intervalo, _coluna_rating(tabela, rating))
 
     query = f"""
         SELECT 
@@ -41,7 +84,7 @@ def estatisticas_de_lances_por_posicao(
             move_san,
             COUNT(*) AS n,
             AVG(mover_score) AS win_rate
-        FROM moves
+        FROM {tabela}
         GROUP BY rating_bracket, fen_before, move_san
         HAVING COUNT(*) >= {min_samples_move}
     """
@@ -55,9 +98,14 @@ def top_k_lances_por_posicao(
     min_rating: int = 200,
     max_rating:int = 1000,
     min_samples_move: int = 1,
+    max_ply: Optional[int] = None,
+    rating: Literal["media", "jogador"] = "media",
 ) -> pd.DataFrame:
     """Via SQL retorna os melhores lances por posição para uma faixa de rating específica.
+    `max_ply` só se aplica, e `rating="jogador"` só existe, para lances expandidos da tabela compactada `games`.
     """
+    tabela = garantir_lances_expandidos(con, max_ply=max_ply)
+    coluna_rating = _coluna_rating(tabela, rating)
     #faixa_expr = definir_faixa_intervalo_sql(intervalo)
 
     #query_antiga = f"""
@@ -94,8 +142,8 @@ def top_k_lances_por_posicao(
                     PARTITION BY fen_before
                     ORDER BY AVG(mover_score) DESC, COUNT(*) DESC
                 ) AS rank
-            FROM moves
-            WHERE average_rating BETWEEN {min_rating} AND {max_rating}
+            FROM {tabela}
+            WHERE {coluna_rating} BETWEEN {min_rating} AND {max_rating}
             GROUP BY fen_before, move_san
             HAVING COUNT(*) >= {min_samples_move}
         )
@@ -107,7 +155,7 @@ def top_k_lances_por_posicao(
 if __name__ == "__main__":
     from src import configs
 
-    con = configs.CONEXAO_BD_PADRAO
+    con = configs.conexao_padrao()
 
     stats = estatisticas_de_lances_por_posicao(con, intervalo=200, min_samples_move=10)
     topk = top_k_lances_por_posicao(con, k=15, min_samples_move=10, min_rating=0, max_rating=4000)
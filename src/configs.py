@@ -10,4 +10,14 @@ CHAVE_API_CHESS = os.getenv("key_lichess")
 MEU_USUARIO = os.getenv("NOME_USUARIO_LICHESS")
 
 # Banco padrao:
-CONEXAO_BD_PADRAO = duckdb.connect("melhores_lances.duckdb")
+CAMINHO_BD_PADRAO = "melhores_lances.duckdb"
+_conexao_bd_padrao = None
+
+def conexao_padrao() -> duckdb.DuckDBPyConnection:
+    """Conexão com o banco padrão, aberta só no primeiro uso para que importar este módulo
+    não trave o arquivo .duckdb (e.g. nos processos filhos da expansão em paralelo)"""
+    global _conexao_bd_padrao
+    if _conexao_bd_padrao is None:
+        _conexao_bd_padrao = duckdb.connect(CAMINHO_BD_PADRAO)
+    return _conexao_bd_padrao
+
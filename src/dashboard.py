@@ -19,7 +19,7 @@ def carregar_analise(path: str) -> pd.DataFrame:
     return pd.read_json(path)
 
 def carregar_analise_inicial_default() -> pd.DataFrame:
-    df = aggregate_data.top_k_lances_por_posicao(con = configs.CONEXAO_BD_PADRAO,
+    df = aggregate_data.top_k_lances_por_posicao(con = configs.conexao_padrao(),
                                             k=15,
                                             min_rating=DEFAULT_MIN_RATING,
                                             max_rating=DEFAUT_MAX_RATING,
@@ -64,7 +64,7 @@ def main():
     def load_data(min_r, max_r):
         
         df = aggregate_data.top_k_lances_por_posicao(
-            con=configs.CONEXAO_BD_PADRAO,
+            con=configs.conexao_padrao(),
             k=15,
             min_rating=min_r,
             max_rating=max_r,
@@ -0,0 +1,169 @@
+"""Extração e codificação dos lances de cada jogo, sem depender do banco de dados
+Fica separado de `process_bulk_games` para os processos da expansão em paralelo importarem só o necessário
+"""
+import struct
+from typing import Tuple, List, Optional
+from enum import IntEnum
+import logging
+
+import chess.pgn
+
+logger = logging.getLogger(__file__)
+
+class ResultadoJogo(IntEnum):
+    EMPATE = 1,
+    VITORIA = 2,
+    DERROTA = 0
+
+
+# Formato dos lances compactados: uint16 little-endian por lance
+# bits 0-5: casa de origem, bits 6-11: casa de destino, bits 12-15: peça de promoção (0 = nenhuma)
+FORMATO_LANCE = "<H"
+
+
+# Funções utilitarias #
+def _formatar_resultado(result: str) -> Tuple[ResultadoJogo, ResultadoJogo]:
+    if result == "1-0":
+        white_score, black_score = ResultadoJogo.VITORIA, ResultadoJogo.DERROTA
+    elif result == "0-1":
+        white_score, black_score = ResultadoJogo.DERROTA, ResultadoJogo.VITORIA
+    elif result == "1/2-1/2":
+        white_score, black_score = ResultadoJogo.EMPATE, ResultadoJogo.EMPATE
+    else:
+        raise ValueError('Sem resultado para o jogo')
+
+    return white_score, black_score
+
+def _ler_cabecalho(game: chess.pgn.Game) -> Optional[Tuple[int, int, str]]:
+    """Retorna (white_rating, black_rating, result) ou None se o jogo deve ser descartado"""
+    headers = game.headers
+    try:
+        white_rating = int(headers['WhiteElo'])
+        black_rating = int(headers['BlackElo'])
+        result = headers["Result"]
+    except (ValueError, KeyError) as e:
+        # Casos de erros mapeados que podem ser descartados aqui com segurança
+        logger.debug(f'Jogo não contém informações válidas sobre o ELO ou resultado, será descartado: {e}')
+        return None
+
+    board = game.board()
+    if type(board) is not chess.Board or board.chess960:
+        logger.debug(f'Jogo de variante ({headers.get("Variant")}) não é suportado, será descartado')
+        return None
+
+    return white_rating, black_rating, result
+
+def codificar_lance(move: chess.Move) -> int:
+    """Codifica um lance em 16 bits (origem, destino e promoção)"""
+    promocao = move.promotion or 0
+    return move.from_square | (move.to_square << 6) | (promocao << 12)
+
+def decodificar_lance(codigo: int) -> chess.Move:
+    """Inverso de `codificar_lance`"""
+    promocao = (codigo >> 12) & 0xF
+    return chess.Move(codigo & 0x3F, (codigo >> 6) & 0x3F, promotion=promocao or None)
+
+def compactar_lances(moves: List[chess.Move]) -> bytes:
+    return struct.pack(f"<{len(moves)}H", *(codificar_lance(m) for m in moves))
+
+def descompactar_lances(dados: bytes) -> List[chess.Move]:
+    return [decodificar_lance(codigo) for (codigo,) in struct.iter_unpack(FORMATO_LANCE, dados)]
+
+
+def extrair_lances(game: chess.pgn.Game) -> List:
+    """Extrai dados dos movimentos de cada jogo"""
+    cabecalho = _ler_cabecalho(game)
+    if cabecalho is None:
+        return []
+    white_rating, black_rating, result = cabecalho
+
+    average_rating = (white_rating + black_rating ) // 2
+    white_score, black_score =  _formatar_resultado(result)
+
+    board = game.board()
+    moves_data = []
+    for ply, move in enumerate(game.mainline_moves(), start=1):
+        mover = "white" if board.turn else "black"
+        # rating = white_rating if mover == "white" else black_rating
+        score = white_score if mover == "white" else black_score
+
+        moves_data.append((
+            ply,
+            board.fen(),
+            board.san(move),
+            mover,
+            average_rating,
+            score,
+        ))
+
+        board.push(move)
+
+    return moves_data
+
+
+def extrair_jogo_compacto(game: chess.pgn.Game) -> Optional[Tuple]:
+    """Extrai os dados do cabeçalho e os lances compactados de um jogo, uma linha por jogo
+
+    Jogos a partir de uma posição (`[FEN]`) guardam a FEN inicial.
+    """
+    cabecalho = _ler_cabecalho(game)
+    if cabecalho is None:
+        return None
+    white_rating, black_rating, result = cabecalho
+
+    white_score, _ = _formatar_resultado(result)
+    moves = list(game.mainline_moves())
+    if not moves:
+        return None
+
+    fen_inicial = game.board().fen() if "FEN" in game.headers else None
+
+    return (
+        white_rating,
+        black_rating,
+        int(white_score),
+        fen_inicial,
+        compactar_lances(moves),
+    )
+
+
+def expandir_jogo(jogo: Tuple, max_ply: Optional[int] = None) -> Optional[List]:
+    """Reconstrói as linhas por posição a partir de um jogo compactado
+
+    Mesmo formato de `extrair_lances`, com o rating de quem move (`mover_rating`) como coluna extra ao final.
+    Retorna None para jogos com FEN ou lances inválidos, que são contabilizados e logados pelo processo principal.
+    """
+    white_rating, black_rating, white_score, fen_inicial, moves_packed = jogo
+    white_score = ResultadoJogo(white_score)
+    black_score = ResultadoJogo(ResultadoJogo.VITORIA - white_score)
+    average_rating = (white_rating + black_rating) // 2
+
+    if max_ply is not None:
+        # Cada lance ocupa 2 bytes, assim nem decodificamos os lances além do limite
+        moves_packed = moves_packed[:2 * max_ply]
+
+    try:
+        board = chess.Board(fen_inicial) if fen_inicial else chess.Board()
+        moves_data = []
+        for ply, move in enumerate(descompactar_lances(moves_packed), start=1):
+            if not board.is_legal(move):
+                raise ValueError(f'Lance ilegal {move.uci()} no ply {ply}')
+            mover = "white" if board.turn else "black"
+            score = white_score if mover == "white" else black_score
+            mover_rating = white_rating if mover == "white" else black_rating
+
+            moves_data.append((
+                ply,
+                board.fen(),
+                board.san(move),
+                mover,
+                average_rating,
+                score,
+                mover_rating,
+            ))
+
+            board.push(move)
+    except ValueError:
+        return None
+
+    return moves_data
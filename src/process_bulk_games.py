@@ -2,9 +2,11 @@
 Faz uso de geradores e DuckDB para processar alguns GBs de dados em um computador fraco
 """
 import io
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
-from typing import Tuple, List, Generator
-from enum import IntEnum
+from typing import Generator, Optional, Tuple
 import time
 from datetime import timedelta
 import logging
@@ -15,6 +17,7 @@ import duckdb
 from tqdm import tqdm
 
 from src import configs
+from src.lances import extrair_lances, extrair_jogo_compacto, expandir_jogo
 
 logging.basicConfig(filename='log_file_name.log',
      level=logging.INFO, 
@@ -24,26 +27,6 @@ logging.basicConfig(filename='log_file_name.log',
      )
 logger = logging.getLogger(__file__)
 
-class ResultadoJogo(IntEnum):
-    EMPATE = 1,
-    VITORIA = 2,
-    DERROTA = 0
-
-
-
-# Funções utilitarias #
-def _formatar_resultado(result: str) -> Tuple[ResultadoJogo, ResultadoJogo]:
-    if result == "1-0":
-        white_score, black_score = ResultadoJogo.VITORIA, ResultadoJogo.DERROTA
-    elif result == "0-1":
-        white_score, black_score = ResultadoJogo.DERROTA, ResultadoJogo.VITORIA
-    elif result == "1/2-1/2":
-        white_score, black_score = ResultadoJogo.EMPATE, ResultadoJogo.EMPATE
-    else:
-        raise ValueError('Sem resultado para o jogo')
-    
-    return white_score, black_score
-
 def itera_jogos(path: Path) -> Generator:
     """Gera os jogos, um por um do .pgn.zst, usando gerador para não carregar tudo em memória de uma vez"""
     with open(path, "rb") as fh:
@@ -57,48 +40,179 @@ def itera_jogos(path: Path) -> Generator:
                 yield game
 
 
-def extrair_lances(game: chess.pgn.Game) -> List:
-    """Extrai dados dos movimentos de cada jogo"""
-    headers = game.headers
+def processa_pgn_para_duckdb_compacto(path: Path, max_games: int=None, chunk_size: int = 50_000,
+                                      conn: Optional[duckdb.DuckDBPyConnection] = None
+                                      ):
+    """Stream PGN -> compactar jogos -> salvar em disco no DuckDB, uma linha por jogo
+
+    Alternativa a `processa_pgn_para_duckdb` que ocupa uma fração do espaço. As linhas por posição
+    são geradas depois, sob demanda, com `expandir_jogos_para_lances`.
+    Cada chamada registra uma nova carga em `games_cargas`, usada para detectar expansões desatualizadas.
+    """
+    if conn is None:
+        conn = configs.conexao_padrao()
+
+    logger.info('Criando tabela de jogos compactados se já não existir..')
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS games (
+            white_rating SMALLINT,
+            black_rating SMALLINT,
+            white_score TINYINT,
+            fen_inicial TEXT,
+            moves_packed BLOB
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS games_cargas (
+            carga INTEGER,
+            n_jogos BIGINT,
+            data TIMESTAMP
+        )
+    """)
+
+    buffer = []
+    total = 0
+
+    INSERT_QUERY = "INSERT INTO games VALUES (?, ?, ?, ?, ?)"
+
+    for i, game in enumerate(tqdm(itera_jogos(path), desc="Compactando jogos")):
+        if max_games and i >= max_games:
+            break
+        try:
+            jogo = extrair_jogo_compacto(game)
+            if jogo:
+                buffer.append(jogo)
+        except Exception as e:
+            logger.exception(f'Erro ao processar o {i}-ésimo jogo, pulando-o...: {e}')
+            continue
+
+        if len(buffer) >= chunk_size:
+            conn.executemany(INSERT_QUERY, buffer)
+            total += len(buffer)
+            logger.info(f"Já foram inseridos no total: {total} jogos")
+            buffer = []
+
+    if buffer:
+        conn.executemany(INSERT_QUERY, buffer)
+        total += len(buffer)
+    conn.execute("""
+        INSERT INTO games_cargas
+        SELECT COALESCE(MAX(carga), 0) + 1, ?, now() FROM games_cargas
+    """, [total])
+    conn.commit()
+    logger.info(f"Salvos no total {total} jogos compactados na tabela")
+
+
+def nome_tabela_expansao(max_ply: Optional[int] = None) -> str:
+    """Nome da tabela com as linhas por posição expandidas de `games` até `max_ply`"""
+    if max_ply is None:
+        return "moves_expandidos"
+    if not isinstance(max_ply, int) or max_ply < 0:
+        raise ValueError(f'max_ply deve ser um inteiro não negativo: {max_ply!r}')
+    return f"moves_expandidos_ply{max_ply}"
+
+
+def versao_games(conn: duckdb.DuckDBPyConnection) -> Tuple[int, int]:
+    """(última carga, número de jogos) da tabela `games`
+
+    Alterações em `games` feitas fora de `processa_pgn_para_duckdb_compacto` que mantenham o número
+    de jogos não são detectadas.
+    """
+    carga = 0
+    if conn.execute(
+        "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = 'games_cargas'"
+    ).fetchone()[0]:
+        carga = conn.execute("SELECT COALESCE(MAX(carga), 0) FROM games_cargas").fetchone()[0]
+    n_jogos = conn.execute("SELECT COUNT(*) FROM games").fetchone()[0]
+    return carga, n_jogos
+
+
+def expandir_jogos_para_lances(conn: Optional[duckdb.DuckDBPyConnection] = None,
+                               *,
+                               max_ply: Optional[int] = None,
+                               chunk_size: int = 10_000,
+                               max_workers: Optional[int] = None,
+                               ) -> str:
+    """Expande a tabela `games` em linhas por posição, em paralelo, (re)criando a tabela de `nome_tabela_expansao`
+
+    Cada `max_ply` tem sua própria tabela, registrada em `expansoes` junto com a versão de `games` usada,
+    assim reagregar com outras regras não descarta as expansões anteriores.
+    Os lances vão para uma tabela temporária, que só substitui a anterior ao final de uma expansão bem sucedida.
+    Retorna o nome da tabela expandida.
+    """
+    if conn is None:
+        conn = configs.conexao_padrao()
+    tabela = nome_tabela_expansao(max_ply)
+    staging = f"{tabela}_staging"
+
+    logger.info(f'Expandindo jogos compactados para a tabela {tabela} (max_ply={max_ply})')
+    conn.execute(f"""
+        CREATE OR REPLACE TABLE "{staging}" (
+            ply INTEGER,
+            fen_before TEXT,
+            move_san TEXT,
+            mover TEXT,
+            average_rating INTEGER,
+            mover_score TINYINT,
+            mover_rating INTEGER
+        )
+    """)
+    INSERT_QUERY = f'INSERT INTO "{staging}" VALUES (?, ?, ?, ?, ?, ?, ?)'
+
+    carga, n_jogos = versao_games(conn)
+    # Cursor separado para a leitura não ser invalidada pelos inserts na conexão principal
+    cursor = conn.cursor().execute(
+        "SELECT white_rating, black_rating, white_score, fen_inicial, moves_packed FROM games"
+    )
+    expandir = partial(expandir_jogo, max_ply=max_ply)
+    total = 0
+    descartados = 0
+    # spawn explícito: os processos só importam `src.lances`, que não abre o banco
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=mp.get_context("spawn")) as executor:
+        while jogos := cursor.fetchmany(chunk_size):
+            buffer = []
+            for moves in executor.map(expandir, jogos, chunksize=256):
+                if moves is None:
+                    descartados += 1
+                else:
+                    buffer.extend(moves)
+            if buffer:
+                conn.executemany(INSERT_QUERY, buffer)
+                total += len(buffer)
+                logger.info(f"Já foram expandidos no total: {total} lances")
+    if descartados:
+        logger.warning(f'{descartados} jogos com FEN ou lances inválidos foram descartados na expansão')
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS expansoes (
+            tabela TEXT PRIMARY KEY,
+            max_ply INTEGER,
+            carga INTEGER,
+            n_jogos BIGINT
+        )
+    """)
+    conn.execute("BEGIN TRANSACTION")
     try:
-        white_rating = int(headers['WhiteElo'])
-        black_rating = int(headers['BlackElo'])
-        result = headers["Result"]
-    except (ValueError, KeyError) as e:
-        # Casos de erros mapeados que podem ser descartados aqui com segurança
-        logger.debug(f'Jogo não contém informações válidas sobre o ELO ou resultado, será descartado: {e}')
-        return []
-
-    average_rating = (white_rating + black_rating ) // 2 
-    white_score, black_score =  _formatar_resultado(result)
-
-    board = game.board()
-    moves_data = []
-    for ply, move in enumerate(game.mainline_moves(), start=1):
-        mover = "white" if board.turn else "black"
-        # rating = white_rating if mover == "white" else black_rating
-        score = white_score if mover == "white" else black_score
-
-        moves_data.append((
-            ply,
-            board.fen(),
-            board.san(move),
-            mover,
-            average_rating,
-            score,
-        ))
-
-        board.push(move)
-
-    return moves_data
+        conn.execute(f'DROP TABLE IF EXISTS "{tabela}"')
+        conn.execute(f'ALTER TABLE "{staging}" RENAME TO "{tabela}"')
+        conn.execute("INSERT OR REPLACE INTO expansoes VALUES (?, ?, ?, ?)",
+                     [tabela, max_ply, carga, n_jogos])
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    logger.info(f"Expandidos no total {total} lances de {n_jogos} jogos na tabela {tabela}")
+    return tabela
 
 
 def processa_pgn_para_duckdb(path: Path, max_games: int=None, chunk_size: int =50_000,
-                             conn: duckdb.DuckDBPyConnection = configs.CONEXAO_BD_PADRAO
+                             conn: Optional[duckdb.DuckDBPyConnection] = None
                              ):
     """Stream PGN -> extrair lançes -> salvar em disco no DuckDB
     Função orquestradora principal do script
     """
+    if conn is None:
+        conn = configs.conexao_padrao()
 
     #TODO mapear mais coisas para integer
     logger.info('Criando tabela se já não existir..')
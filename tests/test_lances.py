@@ -0,0 +1,96 @@
+import io
+
+import chess
+import chess.pgn
+import pytest
+
+from src import lances
+
+PGN_MATE_PASTOR = """[WhiteElo "1500"]
+[BlackElo "1300"]
+[Result "1-0"]
+
+1. e4 e5 2. Qh5 Nc6 3. Bc4 Nf6 4. Qxf7# 1-0
+"""
+
+PGN_PROMOCOES = """[WhiteElo "1000"]
+[BlackElo "1200"]
+[Result "0-1"]
+
+1. a4 h5 2. a5 h4 3. a6 h3 4. axb7 hxg2 5. bxa8=N gxh1=Q 0-1
+"""
+
+PGN_A_PARTIR_DE_POSICAO = """[WhiteElo "1800"]
+[BlackElo "1700"]
+[Result "1/2-1/2"]
+[SetUp "1"]
+[FEN "8/P7/8/8/8/8/8/k6K w - - 0 1"]
+
+1. a8=N Kb2 1/2-1/2
+"""
+
+
+def _ler_jogo(pgn: str) -> chess.pgn.Game:
+    return chess.pgn.read_game(io.StringIO(pgn))
+
+
+@pytest.mark.parametrize("uci", ["e2e4", "a7a8q", "a7a8n", "b2b1r", "h2g1b", "e1g1"])
+def test_codificacao_ida_e_volta(uci):
+    move = chess.Move.from_uci(uci)
+    codigo = lances.codificar_lance(move)
+    assert 0 <= codigo < 2 ** 16
+    assert lances.decodificar_lance(codigo) == move
+
+
+def test_compactar_lances_ida_e_volta():
+    moves = [chess.Move.from_uci(uci) for uci in ["e2e4", "a7a8n", "b2b1r"]]
+    dados = lances.compactar_lances(moves)
+    assert len(dados) == 2 * len(moves)
+    assert lances.descompactar_lances(dados) == moves
+
+
+@pytest.mark.parametrize("pgn", [PGN_MATE_PASTOR, PGN_PROMOCOES, PGN_A_PARTIR_DE_POSICAO])
+def test_expandir_jogo_igual_a_extrair_lances(pgn):
+    jogo = _ler_jogo(pgn)
+    compacto = lances.extrair_jogo_compacto(jogo)
+    # `expandir_jogo` tem `mover_rating` como coluna extra ao final
+    assert [linha[:6] for linha in lances.expandir_jogo(compacto)] == lances.extrair_lances(jogo)
+
+
+def test_jogo_a_partir_de_posicao_guarda_fen_inicial():
+    compacto = lances.extrair_jogo_compacto(_ler_jogo(PGN_A_PARTIR_DE_POSICAO))
+    assert compacto[3] == "8/P7/8/8/8/8/8/k6K w - - 0 1"
+    assert [linha[2] for linha in lances.expandir_jogo(compacto)] == ["a8=N", "Kb2"]
+
+
+def test_expandir_jogo_max_ply():
+    compacto = lances.extrair_jogo_compacto(_ler_jogo(PGN_MATE_PASTOR))
+    completo = lances.expandir_jogo(compacto)
+    assert lances.expandir_jogo(compacto, max_ply=3) == completo[:3]
+    assert lances.expandir_jogo(compacto, max_ply=0) == []
+
+
+def test_expandir_jogo_ratings():
+    compacto = lances.extrair_jogo_compacto(_ler_jogo(PGN_MATE_PASTOR))
+    linhas = lances.expandir_jogo(compacto, max_ply=2)
+    assert [linha[4] for linha in linhas] == [1400, 1400]
+    assert [linha[6] for linha in linhas] == [1500, 1300]
+
+
+def test_expandir_jogo_invalido_descartado():
+    compacto = lances.extrair_jogo_compacto(_ler_jogo(PGN_MATE_PASTOR))
+    # e2e5 não é um lance legal na posição inicial
+    invalido = compacto[:4] + (lances.compactar_lances([chess.Move.from_uci("e2e5")]),)
+    assert lances.expandir_jogo(invalido) is None
+
+
+def test_expandir_jogo_fen_invalida_descartado():
+    compacto = lances.extrair_jogo_compacto(_ler_jogo(PGN_MATE_PASTOR))
+    assert lances.expandir_jogo(compacto[:3] + ("fen invalida",) + compacto[4:]) is None
+
+
+@pytest.mark.parametrize("variante", ["Atomic", "Chess960"])
+def test_variante_descartada_nos_dois_formatos(variante):
+    pgn = PGN_MATE_PASTOR.replace('[Result "1-0"]', f'[Result "1-0"]\n[Variant "{variante}"]')
+    assert lances.extrair_jogo_compacto(_ler_jogo(pgn)) is None
+    assert lances.extrair_lances(_ler_jogo(pgn)) == []
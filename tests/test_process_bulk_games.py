@@ -0,0 +1,86 @@
+import importlib
+import os
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+import duckdb
+import pytest
+import zstandard as zstd
+
+from tests.test_lances import PGN_MATE_PASTOR, PGN_PROMOCOES, PGN_A_PARTIR_DE_POSICAO
+
+RAIZ_REPO = Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture
+def pgn_zst(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / "jogos.pgn.zst"
+    pgn = "\n".join([PGN_MATE_PASTOR, PGN_PROMOCOES, PGN_A_PARTIR_DE_POSICAO])
+    path.write_bytes(zstd.ZstdCompressor().compress(pgn.encode()))
+    return path
+
+
+def test_expansao_compacta_igual_ao_processamento_por_lance(tmp_path, pgn_zst, monkeypatch):
+    process_bulk_games = importlib.import_module("src.process_bulk_games")
+    aggregate_data = importlib.import_module("src.aggregate_data")
+
+    process_bulk_games.processa_pgn_para_duckdb(pgn_zst, conn=duckdb.connect(str(tmp_path / "lances.duckdb")))
+    esperado = duckdb.connect(str(tmp_path / "lances.duckdb")).execute("SELECT * FROM moves ORDER BY ALL").fetchall()
+
+    expansoes = []
+    expandir = process_bulk_games.expandir_jogos_para_lances
+    def expandir_contando(*args, **kwargs):
+        expansoes.append(kwargs.get("max_ply"))
+        return expandir(*args, **kwargs)
+    monkeypatch.setattr(process_bulk_games, "expandir_jogos_para_lances", expandir_contando)
+
+    con = duckdb.connect(str(tmp_path / "compacto.duckdb"))
+    process_bulk_games.processa_pgn_para_duckdb_compacto(pgn_zst, conn=con)
+    tabela = aggregate_data.garantir_lances_expandidos(con)
+    colunas = "ply, fen_before, move_san, mover, average_rating, mover_score"
+    assert con.execute(f"SELECT {colunas} FROM {tabela} ORDER BY ALL").fetchall() == esperado
+
+    # Cada max_ply tem sua tabela: alternar entre regras não re-expande
+    assert aggregate_data.garantir_lances_expandidos(con, max_ply=2) != tabela
+    aggregate_data.top_k_lances_por_posicao(con, min_rating=0, max_rating=4000, rating="jogador")
+    aggregate_data.estatisticas_de_lances_por_posicao(con, max_ply=2)
+    assert expansoes == [None, 2]
+    assert con.execute("SELECT MAX(ply), COUNT(*) FROM moves_expandidos_ply2").fetchone() == (2, 6)
+
+    # Recarregar `games` com o mesmo número de jogos também invalida a expansão
+    con.execute("DELETE FROM games")
+    process_bulk_games.processa_pgn_para_duckdb_compacto(pgn_zst, conn=con)
+    aggregate_data.garantir_lances_expandidos(con)
+    assert expansoes == [None, 2, None]
+    assert not con.execute(
+        "SELECT COUNT(*) FROM information_schema.tables WHERE table_name LIKE '%staging'"
+    ).fetchone()[0]
+
+
+def test_expansao_max_ply_negativo(tmp_path, pgn_zst):
+    process_bulk_games = importlib.import_module("src.process_bulk_games")
+    con = duckdb.connect(str(tmp_path / "compacto.duckdb"))
+    process_bulk_games.processa_pgn_para_duckdb_compacto(pgn_zst, conn=con)
+    with pytest.raises(ValueError):
+        process_bulk_games.expandir_jogos_para_lances(con, max_ply=-2)
+
+
+def test_expansao_em_script_que_importa_configs(tmp_path, pgn_zst):
+    # Processos filhos (spawn) reimportam o __main__ do chamador, que aqui importa `configs`
+    script = tmp_path / "expandir.py"
+    script.write_text(textwrap.dedent("""
+        from src import configs, process_bulk_games
+
+        if __name__ == "__main__":
+            process_bulk_games.processa_pgn_para_duckdb_compacto("jogos.pgn.zst")
+            tabela = process_bulk_games.expandir_jogos_para_lances(max_workers=1)
+            print(configs.conexao_padrao().execute(f"SELECT COUNT(*) FROM {tabela}").fetchone()[0])
+    """))
+    env = {**os.environ, "PYTHONPATH": str(RAIZ_REPO)}
+    resultado = subprocess.run([sys.executable, str(script)], cwd=tmp_path, env=env,
+                               capture_output=True, text=True, timeout=120)
+    assert resultado.returncode == 0, resultado.stderr
+    assert resultado.stdout.strip() == "19"